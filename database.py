@@ -2,21 +2,65 @@
 Database setup for the FastAPI mini-blog.
 
 Responsibilities:
-- Define the SQLite connection URL and async Database instance.
+- Define the SQLite connection URL and the PRAGMAs applied to every connection.
 - Declare SQLAlchemy Core table metadata for users, posts, and comments.
 - Provide a single source of truth for table objects used by route handlers.
 """
 
 
 # === Imports & Setup =========================================================
-import databases
+import os
+
 import sqlalchemy
+from sqlalchemy import event
 
 # === Database URL & engine/metadata =========================================
-DATABASE_URL = "sqlite:///data.db"  # could come from an env var
+def _sqlite_file_path(url: str) -> str:
+    """
+    Return the file path of a file-backed SQLite URL; refuse anything else.
+    db.py opens its own connections to that file (writer + read-only pool),
+    so in-memory databases and URL query arguments cannot be honoured.
+    """
+    parsed = sqlalchemy.engine.make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        raise RuntimeError(f"DATABASE_URL must be a sqlite:/// URL, got {url!r}")
+    if parsed.database in (None, "", ":memory:"):
+        raise RuntimeError(
+            f"DATABASE_URL {url!r} is in-memory; only file-backed SQLite is "
+            "supported. For a RAM-backed database use a tmpfs file, e.g. "
+            "sqlite:////dev/shm/blog.db"
+        )
+    if parsed.query:
+        raise RuntimeError(
+            f"DATABASE_URL {url!r} has query arguments, which are not supported"
+        )
+    return parsed.database
+
+
+# e.g. DATABASE_URL=sqlite:////dev/shm/blog.db keeps a dev/CI database in RAM
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///data.db")
+DATABASE_PATH = _sqlite_file_path(DATABASE_URL)
+# NORMAL is durable enough on disk under WAL; OFF suits throwaway tmpfs databases
+SQLITE_SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+if SQLITE_SYNCHRONOUS not in SQLITE_SYNCHRONOUS_LEVELS:
+    raise RuntimeError(
+        f"SQLITE_SYNCHRONOUS must be one of {sorted(SQLITE_SYNCHRONOUS_LEVELS)}, "
+        f"got {os.environ['SQLITE_SYNCHRONOUS']!r}"
+    )
 metadata = sqlalchemy.MetaData()
-# === Async Database instance =================================================
-database = databases.Database(DATABASE_URL)
+
+# Applied to every SQLite connection: WAL lets readers run alongside a writer,
+# busy_timeout waits instead of failing with SQLITE_BUSY.
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    f"synchronous={SQLITE_SYNCHRONOUS}",
+    "temp_store=MEMORY",
+    "cache_size=-64000",
+    "busy_timeout=5000",
+    "foreign_keys=ON",
+)
+# Async connections (one writer + read-only pool) live in db.py
 
 
 # === Table definitions =======================================================
@@ -51,8 +95,65 @@ comments_table = sqlalchemy.Table(
 )
 
 
+# === Indexes =================================================================
+# Username lookups on every auth call; unique also rejects duplicate sign-ups
+sqlalchemy.Index("ix_users_username", user_table.c.username, unique=True)
+# FK lookups: comments per post (joins/counts), comments/posts per user
+sqlalchemy.Index("ix_comments_post_id", comments_table.c.post_id)
+sqlalchemy.Index("ix_comments_user_id", comments_table.c.user_id)
+sqlalchemy.Index("ix_posts_user_id", posts.c.user_id)
+
+
 # === Engine & metadata creation =============================================
 engine = sqlalchemy.create_engine(
     DATABASE_URL, connect_args={"check_same_thread": False}
 )
-metadata.create_all(engine)
+
+
+def _check_duplicate_usernames(conn) -> None:
+    """
+    Refuse to build ix_users_username over duplicate usernames.
+    Databases created before the index existed may hold them (sign-up had no
+    uniqueness check); fail with the migration step instead of a bare
+    UNIQUE constraint error. See README, "Upgrading an existing data.db".
+    """
+    if sqlalchemy.inspect(conn).has_index("users", "ix_users_username"):
+        return
+    query = (
+        sqlalchemy.select(user_table.c.username)
+        .group_by(user_table.c.username)
+        .having(sqlalchemy.func.count() > 1)
+    )
+    duplicates = conn.execute(query).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"Duplicate usernames in {DATABASE_URL}: "
+            f"{', '.join(map(repr, duplicates))}. "
+            "Rename all but the oldest account before starting, e.g.: "
+            "UPDATE users SET username = username || '_' || id "
+            "WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY username);"
+        )
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    """Apply SQLITE_PRAGMAS to each new sync engine connection."""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+# BEGIN IMMEDIATE takes the write lock before any "exists?" checks, so several
+# uvicorn workers starting on a fresh file don't race to create the same tables
+with engine.connect() as _conn:
+    _conn.exec_driver_sql("BEGIN IMMEDIATE")
+    metadata.create_all(_conn)
+    _check_duplicate_usernames(_conn)
+    # create_all skips indexes of tables that already exist; add any missing ones
+    for _table in metadata.sorted_tables:
+        for _index in _table.indexes:
+            _index.create(_conn, checkfirst=True)
+    # Refresh planner statistics so SQLite picks the indexes above
+    _conn.exec_driver_sql("ANALYZE")
+    _conn.commit()
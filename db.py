@@ -0,0 +1,146 @@
+"""
+Async SQLite connections for the FastAPI mini-blog (aiosqlite).
+
+Responsibilities:
+- Own one long-lived write connection and a small pool of read-only connections.
+- Apply SQLITE_PRAGMAS once per connection, when it is opened.
+- Lend read connections via a FastAPI dependency; handlers take the single
+  writer with write_connection() only around their write statements.
+- Run SQLAlchemy Core statements on a connection; rows come back as dicts.
+  Statements are compiled once and cached, so hoist them to module level and
+  pass per-request values as bind parameters.
+"""
+
+# === Imports & Setup =========================================================
+import asyncio
+import contextlib
+import functools
+import pathlib
+
+import aiosqlite
+from sqlalchemy.dialects import sqlite
+
+from database import DATABASE_PATH, SQLITE_PRAGMAS
+
+# === Configuration ===========================================================
+READ_POOL_SIZE = 4
+_dialect = sqlite.dialect(paramstyle="named")
+
+# === Connection state (set up in connect) ====================================
+_write_conn: aiosqlite.Connection | None = None
+_write_lock: asyncio.Lock | None = None
+_read_pool: asyncio.Queue | None = None
+
+
+# === Lifecycle ===============================================================
+def _row_factory(cursor, row) -> dict:
+    """Return rows as plain dicts keyed by column name."""
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+async def _open(uri: str) -> aiosqlite.Connection:
+    """Open an autocommit connection and apply the PRAGMAs once."""
+    conn = await aiosqlite.connect(uri, uri=True, isolation_level=None)
+    conn.row_factory = _row_factory
+    await conn.executescript("".join(f"PRAGMA {p};" for p in SQLITE_PRAGMAS))
+    return conn
+
+
+async def connect() -> None:
+    """Open the writer first (switches the file to WAL), then the readers."""
+    global _write_conn, _write_lock, _read_pool
+    uri = pathlib.Path(DATABASE_PATH).resolve().as_uri()
+    _write_conn = await _open(uri)
+    _write_lock = asyncio.Lock()
+    _read_pool = asyncio.Queue()
+    for _ in range(READ_POOL_SIZE):
+        _read_pool.put_nowait(await _open(f"{uri}?mode=ro"))
+
+
+async def disconnect() -> None:
+    """Close the pooled readers and the writer."""
+    while not _read_pool.empty():
+        await _read_pool.get_nowait().close()
+    await _write_conn.close()
+
+
+# === Connection access =======================================================
+@contextlib.asynccontextmanager
+async def read_connection():
+    """Borrow a read-only connection from the pool; return it afterwards."""
+    conn = await _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put_nowait(conn)
+
+
+async def get_read_conn():
+    """Request dependency: a read-only connection for the handler."""
+    async with read_connection() as conn:
+        yield conn
+
+
+@contextlib.asynccontextmanager
+async def write_connection():
+    """
+    Hold the single writer for the block, so writes are serialized (no
+    SQLITE_BUSY between concurrent writers). Keep slow non-DB work outside.
+    """
+    async with _write_lock:
+        yield _write_conn
+
+
+@contextlib.asynccontextmanager
+async def transaction(conn: aiosqlite.Connection):
+    """
+    Run the block as one transaction (single commit); roll back on error.
+    Use with the writer from write_connection(), which is held exclusively.
+    """
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+
+
+# === Query helpers (SQLAlchemy Core → aiosqlite) =============================
+@functools.lru_cache(maxsize=128)
+def _compile(query) -> tuple[str, dict]:
+    """Compile a Core statement to SQLite SQL with named parameters (memoized)."""
+    compiled = query.compile(dialect=_dialect)
+    return str(compiled), compiled.params
+
+
+def _prepare(query, params: dict | None) -> tuple[str, dict]:
+    """Return cached SQL plus the statement's literal params overlaid with `params`."""
+    sql, defaults = _compile(query)
+    return sql, {**defaults, **params} if params else defaults
+
+
+async def fetch_all(
+    conn: aiosqlite.Connection, query, params: dict | None = None
+) -> list[dict]:
+    """Run a SELECT and return all rows."""
+    sql, params = _prepare(query, params)
+    return list(await conn.execute_fetchall(sql, params))
+
+
+async def fetch_one(
+    conn: aiosqlite.Connection, query, params: dict | None = None
+) -> dict | None:
+    """Run a SELECT (or INSERT ... RETURNING) and return the first row, or None."""
+    sql, params = _prepare(query, params)
+    async with conn.execute(sql, params) as cursor:
+        return await cursor.fetchone()
+
+
+async def execute(
+    conn: aiosqlite.Connection, query, params: dict | None = None
+) -> int:
+    """Run a write statement and return the last inserted row id."""
+    sql, params = _prepare(query, params)
+    async with conn.execute(sql, params) as cursor:
+        return cursor.lastrowid
@@ -13,31 +13,121 @@ Conventions:
 """
 
 # === Imports & Setup =========================================================
-from database import database, posts, user_table, comments_table
-from fastapi import FastAPI, HTTPException, status, Depends, Query, Response
+import asyncio
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import aiosqlite
+import orjson
+import sqlalchemy
+from sqlalchemy import bindparam
+import db
+from database import posts, user_table, comments_table
+from fastapi import (FastAPI, HTTPException, status, Depends, Query, Request,
+                     Response)
 from models.post import (UserPost, UserPostIn, CommentOut,
-                         CommentIn, UserPostWithComments)
+                         CommentIn, UserPostWithComments, UserPostPage)
 from models.user import UserIn, User
 from security import (get_password_hash, create_access_token,
-                      authenticate_user, get_current_user)
+                      authenticate_user, get_current_user, invalidate_user)
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.docs import get_swagger_ui_html
 
+# === Prepared statements (built and compiled once, bound per request) =======
+INSERT_USER = user_table.insert().values(
+    username=bindparam("username"), password=bindparam("password")
+)
+INSERT_POST = posts.insert().values(
+    body=bindparam("body"), user_id=bindparam("user_id")
+).returning(posts.c.id)
+INSERT_COMMENT = comments_table.insert().values(
+    body=bindparam("body"), post_id=bindparam("post_id"),
+    user_id=bindparam("user_id"),
+).returning(comments_table.c.id)
+DELETE_COMMENTS = comments_table.delete()
+DELETE_POSTS = posts.delete()
+
+# Only CommentOut fields: read responses bypass response-model filtering
+COMMENTS_BY_POST = (
+    sqlalchemy.select(
+        comments_table.c.id, comments_table.c.body, comments_table.c.post_id
+    )
+    .where(comments_table.c.post_id == bindparam("post_id"))
+)
+
+# One round-trip: SQLite aggregates the comments into a JSON array
+_comment_json = sqlalchemy.func.json_object(
+    "id", comments_table.c.id,
+    "body", comments_table.c.body,
+    "post_id", comments_table.c.post_id,
+)
+POST_WITH_COMMENTS = (
+    sqlalchemy.select(
+        posts.c.id,
+        posts.c.body,
+        sqlalchemy.func.coalesce(
+            sqlalchemy.func.json_group_array(_comment_json)
+            .filter(comments_table.c.id.isnot(None)),
+            "[]",
+        ).label("comments"),
+    )
+    .select_from(posts.outerjoin(
+        comments_table, comments_table.c.post_id == posts.c.id
+    ))
+    .where(posts.c.id == bindparam("post_id"))
+    .group_by(posts.c.id)
+)
+
+# Newest-first page of posts with comment counts; *_AFTER seeks past a cursor
+POSTS_PAGE = (
+    sqlalchemy.select(
+        posts.c.id,
+        posts.c.body,
+        sqlalchemy.func.count(comments_table.c.id).label("comment_count"),
+    )
+    .select_from(posts.outerjoin(
+        comments_table, comments_table.c.post_id == posts.c.id
+    ))
+    .group_by(posts.c.id)
+    .order_by(posts.c.id.desc())
+    .limit(bindparam("limit"))
+)
+POSTS_PAGE_AFTER = POSTS_PAGE.where(posts.c.id < bindparam("after_id"))
+
+
 # === Application =============================================================
-app = FastAPI(docs_url=None, redoc_url=None)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with long-lived client caching; asset URLs carry a ?v= version."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["cache-control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+app = FastAPI(
+    docs_url=None, redoc_url=None, default_response_class=ORJSONResponse
+)
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 
 # === Setup Events =============================================================
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    # Password hashing runs in the default executor; PBKDF2 releases the GIL,
+    # so one worker per core lets concurrent logins hash in parallel
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=os.cpu_count())
+    )
+    await db.connect()
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    await db.disconnect()
 
 
 # === Color Theme: Swagger UI Docs ===========================================
@@ -47,7 +137,7 @@ async def custom_swagger_ui():
         openapi_url=(app.openapi_url or "/openapi.json"),
         title="FastAPI Mini-Blog — Docs",
         swagger_js_url="https://cdn.jsdelivr.net/npm/swagger-ui-dist@5/swagger-ui-bundle.js",
-        # Use our combined CSS (imports default + overrides)
+        # Use our combined CSS (imports default + overrides); bump ?v= on edits
         swagger_css_url="/static/swagger-dark.css?v=1",
     )
 
@@ -61,21 +151,28 @@ def verify_maintainer(user: User = Depends(get_current_user)) -> User:
     return user
 
 
+HEALTH_RESPONSE = ORJSONResponse({"status": "ok"})  # built once, reused
+
+
 @app.get("/health")
 async def health():
     """
     Lightweight liveness probe.
     """
-    return {"status": "ok"}
+    return HEALTH_RESPONSE
 
 
 @app.post("/_dev/reset", status_code=204)
 async def dev_reset_db(_: User = Depends(verify_maintainer)):
     """
-    Dev-only maintenance: clear comments then posts. Returns 204 No Content.
+    Dev-only maintenance: clear comments and posts in one transaction.
+    Returns 204 No Content.
     """
-    await database.execute(comments_table.delete())
-    await database.execute(posts.delete())
+    async with db.write_connection() as conn, db.transaction(conn):
+        # FK checks run at COMMIT, so delete order inside the block is free
+        await conn.execute("PRAGMA defer_foreign_keys=ON")
+        await db.execute(conn, DELETE_COMMENTS)
+        await db.execute(conn, DELETE_POSTS)
     return Response(status_code=204)
 
 
@@ -83,11 +180,19 @@ async def dev_reset_db(_: User = Depends(verify_maintainer)):
 @app.post("/register", status_code=201)
 async def register(user: UserIn):
     """
-    Register a user and return an access token.
+    Register a user and return an access token (409 if the username is taken).
     """
-    hashed_password = get_password_hash(user.password)
-    query = user_table.insert().values(username=user.username, password=hashed_password)
-    await database.execute(query)
+    # Hash before taking the writer so other writes don't queue behind PBKDF2
+    hashed_password = await get_password_hash(user.password)
+    params = {"username": user.username, "password": hashed_password}
+    async with db.write_connection() as conn:
+        try:
+            await db.execute(conn, INSERT_USER, params)
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=409, detail="Username already registered"
+            )
+    invalidate_user(user.username)
     access_token = create_access_token(user.username)
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -108,7 +213,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(user.username)
+    access_token = create_access_token(user["username"])
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -120,10 +225,12 @@ async def create_post(
     """
     Create a new post for the authenticated user. Returns the created post.
     """
-    data = {**post.dict(), "user_id": current_user.id}
-    query = posts.insert().values(data)
-    last_record_id = await database.execute(query)
-    return {**data, "id": last_record_id}
+    data = post.model_dump()
+    data["user_id"] = current_user.id
+    async with db.write_connection() as conn:
+        row = await db.fetch_one(conn, INSERT_POST, data)
+    data["id"] = row["id"]
+    return data
 
 
 @app.post("/comment", status_code=201, response_model=CommentOut)
@@ -134,52 +241,99 @@ async def create_comment(
     Add a comment to an existing post (404 if post_id does not exist).
     Returns the created comment (minimal response model).
     """
-    # --- FK validation: ensure post exists ---
-    query_post = posts.select().where(posts.c.id == comment.post_id)
-    post = await database.fetch_one(query_post)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-
-    # --- proceed normally ---
-    data = {**comment.dict(), "user_id": current_user.id}
-    query = comments_table.insert().values(data)
-    last_record_id = await database.execute(query)
-    return {**data, "id": last_record_id}
+    data = comment.model_dump()
+    data["user_id"] = current_user.id
+    # --- FK validation: foreign_keys=ON rejects a missing post_id ---
+    async with db.write_connection() as conn:
+        try:
+            row = await db.fetch_one(conn, INSERT_COMMENT, data)
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=404, detail="Post not found")
+    data["id"] = row["id"]
+    return data
 
 
 # === Read endpoints ==========================================================
+READ_CACHE_CONTROL = "private, max-age=5, stale-while-revalidate=30"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Weak comparison of an If-None-Match header against `etag` (RFC 9110):
+    `*` matches any existing resource; otherwise compare each listed tag
+    exactly, ignoring a `W/` prefix.
+    """
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def etag_json_response(request: Request, content) -> Response:
+    """
+    Serialize `content` once and tag it with an ETag of the body.
+    Returns 304 Not Modified (no body) when the client's If-None-Match matches.
+    """
+    body = orjson.dumps(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": READ_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @app.get("/post/{post_id}/comments", response_model=list[CommentOut])
-async def get_comments_on_post(post_id: int):
+async def get_comments_on_post(
+    post_id: int,
+    request: Request,
+    conn: aiosqlite.Connection = Depends(db.get_read_conn),
+):
     """
-    List comments for a specific post with optional pagination.
+    List comments for a specific post (ETag / 304 aware).
     """
-    query = comments_table.select().where(comments_table.c.post_id == post_id)
-    return await database.fetch_all(query)
+    rows = await db.fetch_all(conn, COMMENTS_BY_POST, {"post_id": post_id})
+    return etag_json_response(request, rows)
 
 
 @app.get("/posts/{post_id}", response_model=UserPostWithComments)
-async def get_post_with_comments(post_id: int):
+async def get_post_with_comments(
+    post_id: int,
+    request: Request,
+    conn: aiosqlite.Connection = Depends(db.get_read_conn),
+):
     """
-    Retrieve a single post and its comments (404 if not found).
+    Retrieve a single post and its comments (404 if not found; ETag / 304 aware).
     """
-    query = posts.select().where(posts.c.id == post_id)
-    post = await database.fetch_one(query)
+    post = await db.fetch_one(conn, POST_WITH_COMMENTS, {"post_id": post_id})
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    query = comments_table.select().where(comments_table.c.post_id == post_id)
-    comments = await database.fetch_all(query)
-    return {**dict(post), "comments": comments}
+    # Trusted DB output: skip response-model revalidation
+    # Rows are plain dicts: fill in the parsed comments in place, no copy
+    post["comments"] = orjson.loads(post["comments"])
+    return etag_json_response(request, post)
 
 
-@app.get("/posts", response_model=list[UserPost])
+@app.get("/posts", response_model=UserPostPage)
 async def get_all_posts(
     limit: int = Query(10, ge=1, le=100),
-    skip: int = Query(0, ge=0),
+    after_id: int | None = Query(None, ge=1),
+    conn: aiosqlite.Connection = Depends(db.get_read_conn),
 ):
     """
-    List posts with optional pagination (limit/skip).
+    List posts newest-first with keyset pagination, including comment counts.
+    Pass the returned `next_cursor` as `after_id` to fetch the next page.
     """
-    query = posts.select().order_by(posts.c.id.desc()).limit(limit).offset(skip)
-    rows = await database.fetch_all(query)
-    return rows
+    # Fetch one extra row: it only signals that another page exists
+    if after_id is None:
+        rows = await db.fetch_all(conn, POSTS_PAGE, {"limit": limit + 1})
+    else:
+        params = {"limit": limit + 1, "after_id": after_id}
+        rows = await db.fetch_all(conn, POSTS_PAGE_AFTER, params)
+    next_cursor = None
+    if len(rows) > limit:
+        del rows[limit:]
+        next_cursor = rows[-1]["id"]
+    # Trusted DB output (UserPostWithCount fields): skip revalidation
+    return ORJSONResponse({"items": rows, "next_cursor": next_cursor})
 # === End of file =============================================================
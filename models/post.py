@@ -5,6 +5,7 @@ Defines:
 - Input and output schemas for posts and comments.
 - Variants that hide internal fields (e.g., user_id) from API responses.
 - Combined model (UserPostWithComments) for nested post detail views.
+- Paginated wrapper (UserPostPage) for keyset-paginated post lists.
 """
 
 # === Imports & Setup =========================================================
@@ -22,6 +23,11 @@ class UserPost(UserPostIn):
     id: int
 
 
+class UserPostWithCount(UserPost):
+    """Post list item: a post plus its number of comments."""
+    comment_count: int = 0
+
+
 # === Comment models ==========================================================
 class CommentIn(BaseModel):
     """Incoming comment payload with post_id reference."""
@@ -47,3 +53,9 @@ class UserPostWithComments(UserPost):
     """Nested model combining a post and its list of comments."""
     comments: list[CommentOut]
 
+
+class UserPostPage(BaseModel):
+    """One page of posts plus the cursor (last id) for the next page, if any."""
+    items: list[UserPostWithCount]
+    next_cursor: int | None = None
+
@@ -2,17 +2,27 @@
 Security utilities for the FastAPI mini-blog.
 
 Includes:
-- Password hashing/verification (passlib: PBKDF2-SHA256).
-- JWT creation/verification (python-jose).
+- Password hashing/verification (hashlib PBKDF2-SHA256, passlib-compatible
+  hash strings), run off the event loop.
+- JWT creation/verification (PyJWT, HS256; key and decode options precomputed).
 - OAuth2 bearer token dependency for protected routes.
-- Helpers: authenticate_user, get_current_user (DB-backed).
+- Helpers: authenticate_user, get_current_user (DB-backed, read-only pool),
+  with user rows cached in-process for USER_CACHE_TTL_SECONDS.
 """
 
 # === Imports & Setup =========================================================
-from passlib.context import CryptContext
+import asyncio
+import base64
 import datetime
-from jose import JWTError, jwt
-from database import database, user_table
+import hashlib
+import hmac
+import secrets
+import sqlalchemy
+from cachetools import TTLCache
+import jwt
+from database import user_table
+from db import fetch_one, read_connection
+from models.user import User
 from fastapi import status, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
@@ -20,68 +30,123 @@ from fastapi.security import OAuth2PasswordBearer
 # === Configuration (JWT & password hashing) ==================================
 SECRET_KEY = "9b73f2a1bdd7ae163444473d29a6885ffa22ab26117068f72a5a56a74d12d1fc"
 ALGORITHM = "HS256"
+_SECRET_BYTES = SECRET_KEY.encode()
+_DECODE_ALGORITHMS = (ALGORITHM,)
+_DECODE_OPTIONS = {"require": ["exp", "sub"]}
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+USER_CACHE_TTL_SECONDS = 60
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Same parameters as passlib's pbkdf2_sha256, so existing hashes keep verifying
+PBKDF2_SCHEME = "pbkdf2-sha256"
+PBKDF2_ROUNDS = 29000
+PBKDF2_SALT_BYTES = 16
 
 
 # === Token & password helpers ================================================
-def create_access_token(id_: str):
+def create_access_token(id_: str) -> str:
     """Create a signed JWT (HS256) for the given username (sub) with an expiry."""
-    expire = datetime.datetime.utcnow() + datetime.timedelta(
+    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
         minutes=ACCESS_TOKEN_EXPIRE_MINUTES
     )
     jwt_data = {"sub": id_, "exp": expire}
-    encoded_jwt = jwt.encode(jwt_data, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(jwt_data, _SECRET_BYTES, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def get_password_hash(password: str) -> str:
-    """Hash a plaintext password using PBKDF2-SHA256 (passlib)."""
-    return pwd_context.hash(password)
+def _ab64_encode(data: bytes) -> str:
+    """passlib's "adapted base64": unpadded, with '.' in place of '+'."""
+    return base64.b64encode(data).decode().rstrip("=").replace("+", ".")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify plaintext password against a stored PBKDF2-SHA256 hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+def _ab64_decode(text: str) -> bytes:
+    """Inverse of _ab64_encode."""
+    text = text.replace(".", "+")
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _hash_password(password: str) -> str:
+    """PBKDF2-SHA256 via hashlib (OpenSSL), formatted as $pbkdf2-sha256$rounds$salt$hash."""
+    salt = secrets.token_bytes(PBKDF2_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ROUNDS)
+    return f"${PBKDF2_SCHEME}${PBKDF2_ROUNDS}${_ab64_encode(salt)}${_ab64_encode(digest)}"
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Recompute the PBKDF2 digest with the stored salt/rounds; constant-time compare."""
+    try:
+        _, scheme, rounds, salt, checksum = hashed_password.split("$")
+        if scheme != PBKDF2_SCHEME:
+            return False
+        expected = _ab64_decode(checksum)
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", plain_password.encode(), _ab64_decode(salt), int(rounds)
+        )
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+async def get_password_hash(password: str) -> str:
+    """Hash a plaintext password in a worker thread (keeps the loop free)."""
+    return await asyncio.to_thread(_hash_password, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a plaintext password against a stored hash in a worker thread."""
+    return await asyncio.to_thread(_verify_password, plain_password, hashed_password)
 
 
 # === Auth helpers (DB lookups) ===============================================
-async def get_user(username: str):
-    """Fetch a user row by username; return the row or None if missing."""
-    query = user_table.select().where(user_table.c.username == username)
-    result = await database.fetch_one(query)
-    if result:
-        return result
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL_SECONDS)
+USER_BY_USERNAME = user_table.select().where(
+    user_table.c.username == sqlalchemy.bindparam("username")
+)
+
+
+async def get_user(username: str) -> dict | None:
+    """Fetch a user row by username (cached); return the row or None if missing."""
+    if (user := _user_cache.get(username)) is not None:
+        return user
+    async with read_connection() as conn:
+        user = await fetch_one(conn, USER_BY_USERNAME, {"username": username})
+    if user is not None:
+        _user_cache[username] = user
+    return user
+
+
+def invalidate_user(username: str) -> None:
+    """Drop a cached user row (call after writing to that user)."""
+    _user_cache.pop(username, None)
 
 
-async def authenticate_user(username: str, password: str):
-    """Validate credentials; return user row if ok, else False."""
+async def authenticate_user(username: str, password: str) -> dict | None:
+    """Validate credentials; return user row if ok, else None."""
     user = await get_user(username)
-    if not user:
-        return False
-    if not verify_password(password, user.password):
-        return False
+    if user is None:
+        return None
+    if not await verify_password(password, user["password"]):
+        return None
     return user
 
 
 # === Request dependency: current user ========================================
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    """Decode bearer JWT, load the user by `sub`, and return the DB row (401 on failure)."""
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    """Decode bearer JWT, load the user by `sub`, and return it as a User (401 on failure)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+        payload = jwt.decode(
+            token, _SECRET_BYTES,
+            algorithms=_DECODE_ALGORITHMS, options=_DECODE_OPTIONS,
+        )
+    except jwt.InvalidTokenError:
         raise credentials_exception
+    username: str = payload["sub"]
     user = await get_user(username=username)
     if user is None:
         raise credentials_exception
-    return user
+    return User.model_validate(user)